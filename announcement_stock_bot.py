@@ -1,27 +1,64 @@
 from __future__ import annotations
 
+import functools
+import hashlib
+import json
 import logging
+import mmap
 import os
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from datetime import datetime
 from pathlib import Path
-from typing import Iterable, Optional, Union
+from typing import Any, Iterable, Optional, Union
 
 import requests
 from catboxpy import CatboxClient
+from requests.adapters import HTTPAdapter
+from requests_toolbelt import MultipartEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 GOFILE_ENDPOINT = "https://upload.gofile.io/uploadfile"
+# (connect, read) timeouts in seconds for Gofile uploads.
+GOFILE_TIMEOUT = (10, 300)
 DEFAULT_THRESHOLD_MB = 200.0
+READ_CHUNK_SIZE = 1 << 20
+MMAP_MIN_SIZE = 64 * 1024
+# Both markers are ASCII, so lines are matched as raw bytes and never decoded.
+ULP_SEPARATOR = b":"
+NOT_SAVED_MARKER = b"[NOT_SAVED]"
+_NON_ULP_BYTES = bytes(
+    byte for byte in range(256) if byte not in b"\n" + ULP_SEPARATOR
+)
+MAX_UPLOAD_WORKERS = 8
+UPLOAD_ATTEMPTS = 3
+UPLOAD_RETRY_DELAY = 1.0
+DIGEST_ALGORITHM = "blake2b"
 
 LOGGER = logging.getLogger(__name__)
 
+# One keep-alive session for every Gofile upload, so repeated calls to
+# generate_announcement reuse TLS connections instead of leaking pools.
+_gofile_session: Optional[requests.Session] = None
+_gofile_session_lock = threading.Lock()
+
+# (epoch second, formatted text) so a batch formats the time once a second.
+_timestamp_cache: tuple[int, str] = (-1, "")
+
 
 @dataclass(frozen=True)
 class FileMetrics:
     filename: str
-    total_lines: int
-    valid_ulp: int
+    total_lines: Optional[int]
+    valid_ulp: Optional[int]
     size_bytes: int
+    digest: Optional[str] = None
 
     @property
     def size_mb(self) -> float:
@@ -36,22 +73,97 @@ class UploadResult:
     error: Optional[str] = None
 
 
+class UploadCache:
+    """JSON-backed map from file content digest to a successful upload."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self) -> dict[str, dict[str, str]]:
+        try:
+            with self.path.open("r", encoding="utf-8") as handle:
+                entries = json.load(handle)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as exc:
+            LOGGER.warning("Ignoring upload cache %s: %s", self.path, exc)
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def get(self, digest: str) -> Optional[UploadResult]:
+        with self._lock:
+            entry = self._entries.get(digest)
+        if not entry:
+            return None
+        try:
+            return UploadResult(
+                host=entry["host"], url=entry["url"], success=True
+            )
+        except (KeyError, TypeError):
+            # Hand-edited or damaged entry; treat it as a miss.
+            return None
+
+    def put(self, digest: str, result: UploadResult) -> None:
+        if not result.success:
+            return
+        with self._lock:
+            self._entries[digest] = {"host": result.host, "url": result.url}
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            # The upload already succeeded, so a cache that cannot be
+            # written must not turn it into a failure.
+            try:
+                tmp_path.write_text(
+                    json.dumps(self._entries), encoding="utf-8"
+                )
+                os.replace(tmp_path, self.path)
+            except OSError as exc:
+                LOGGER.warning(
+                    "Could not write upload cache %s: %s", self.path, exc
+                )
+
+
 class GofileUploader:
     def __init__(self, endpoint: str = GOFILE_ENDPOINT) -> None:
         self.endpoint = endpoint
         self.guest_token: Optional[str] = None
         self.folder_id: Optional[str] = None
+        self._lock = threading.RLock()
+        self.session = _shared_gofile_session()
 
     def upload_once(self, file_path: Path) -> str:
+        # The first upload creates the guest folder, so hold the lock until
+        # it finishes and concurrent uploads land in the same folder.
+        with self._lock:
+            if not self.guest_token:
+                return self._upload(file_path)
+        return self._upload(file_path)
+
+    def _upload(self, file_path: Path) -> str:
         data: dict[str, str] = {}
-        if self.guest_token:
-            data["guestToken"] = self.guest_token
-        if self.folder_id:
-            data["folderId"] = self.folder_id
-
-        with file_path.open("rb") as handle:
-            response = requests.post(
-                self.endpoint, data=data, files={"file": handle}
+        with self._lock:
+            if self.guest_token:
+                data["guestToken"] = self.guest_token
+            if self.folder_id:
+                data["folderId"] = self.folder_id
+
+        with file_path.open("rb", buffering=READ_CHUNK_SIZE) as handle:
+            encoder = MultipartEncoder(
+                fields={
+                    **data,
+                    "file": (
+                        file_path.name,
+                        handle,
+                        "application/octet-stream",
+                    ),
+                }
+            )
+            response = self.session.post(
+                self.endpoint,
+                data=encoder,
+                headers={"Content-Type": encoder.content_type},
+                timeout=GOFILE_TIMEOUT,
             )
 
         if not response.ok:
@@ -59,7 +171,10 @@ class GofileUploader:
                 f"Gofile upload failed: {response.status_code} {response.text}"
             )
 
-        payload = response.json()
+        if orjson is not None:
+            payload = orjson.loads(response.content)
+        else:
+            payload = response.json()
         if payload.get("status") != "ok":
             raise RuntimeError(f"Gofile upload failed: {payload}")
 
@@ -68,10 +183,11 @@ class GofileUploader:
             data_payload.get("guestToken") or payload.get("guestToken")
         )
         folder_id = data_payload.get("folderId") or payload.get("folderId")
-        if guest_token:
-            self.guest_token = guest_token
-        if folder_id:
-            self.folder_id = folder_id
+        with self._lock:
+            if guest_token:
+                self.guest_token = guest_token
+            if folder_id:
+                self.folder_id = folder_id
 
         url = (
             data_payload.get("downloadPage")
@@ -85,6 +201,21 @@ class GofileUploader:
         return url
 
 
+def _shared_gofile_session() -> requests.Session:
+    global _gofile_session
+    with _gofile_session_lock:
+        if _gofile_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=MAX_UPLOAD_WORKERS,
+                pool_maxsize=MAX_UPLOAD_WORKERS,
+            )
+            session.mount("https://", adapter)
+            session.headers["Connection"] = "keep-alive"
+            _gofile_session = session
+        return _gofile_session
+
+
 class AnnouncementUploader:
     def __init__(
         self,
@@ -92,12 +223,12 @@ class AnnouncementUploader:
         catbox_userhash: Optional[str] = None,
     ) -> None:
         self.threshold_mb = threshold_mb
+        self.threshold_bytes = threshold_mb * 1024 * 1024
         self.catbox_client = CatboxClient(catbox_userhash)
         self.gofile_uploader = GofileUploader()
 
     def upload(self, file_path: Path, size_bytes: int) -> UploadResult:
-        size_mb = size_bytes / (1024 * 1024)
-        if size_mb <= self.threshold_mb:
+        if size_bytes <= self.threshold_bytes:
             return self._upload_with_retry(
                 host="Catbox",
                 upload_fn=lambda: self.catbox_client.file_upload(
@@ -110,22 +241,27 @@ class AnnouncementUploader:
         )
 
     def _upload_with_retry(self, host: str, upload_fn) -> UploadResult:
-        try:
-            url = upload_fn()
-            return UploadResult(host=host, url=url, success=True)
-        except Exception as exc:  # noqa: BLE001
-            LOGGER.warning("%s upload failed, retrying: %s", host, exc)
+        for attempt in range(UPLOAD_ATTEMPTS - 1):
             try:
                 url = upload_fn()
                 return UploadResult(host=host, url=url, success=True)
-            except Exception as retry_exc:  # noqa: BLE001
-                error_text = str(retry_exc).replace("\n", " ").strip()
-                return UploadResult(
-                    host=host,
-                    url=f"Upload failed: {error_text}",
-                    success=False,
-                    error=error_text,
+            except Exception as exc:  # noqa: BLE001
+                delay = UPLOAD_RETRY_DELAY * 2**attempt
+                LOGGER.warning(
+                    "%s upload failed, retrying in %.0fs: %s", host, delay, exc
                 )
+                time.sleep(delay)
+        try:
+            url = upload_fn()
+            return UploadResult(host=host, url=url, success=True)
+        except Exception as retry_exc:  # noqa: BLE001
+            error_text = str(retry_exc).replace("\n", " ").strip()
+            return UploadResult(
+                host=host,
+                url=f"Upload failed: {error_text}",
+                success=False,
+                error=error_text,
+            )
 
 
 def generate_announcement(
@@ -134,6 +270,8 @@ def generate_announcement(
     display_count: Optional[Union[int, str]] = None,
     threshold_mb: float = DEFAULT_THRESHOLD_MB,
     catbox_userhash: Optional[str] = None,
+    include_stats: bool = True,
+    upload_cache: Optional[Union[str, Path]] = None,
 ) -> list[str]:
     """
     Generate announcement messages for a list of files.
@@ -144,20 +282,43 @@ def generate_announcement(
         display_count: Optional count for the original dataset scale.
         threshold_mb: Size threshold to route uploads to Catbox vs Gofile.
         catbox_userhash: Optional Catbox userhash for account uploads.
+        include_stats: Set to False to skip the line scan and leave the
+            ULP/line counts out of the message. The scan still runs when
+            the header needs the line count.
+        upload_cache: Optional JSON file that remembers uploads by content
+            digest, so re-announcing an identical file reuses its link.
     """
     file_list = _normalize_files(files)
     uploader = AnnouncementUploader(
         threshold_mb=threshold_mb, catbox_userhash=catbox_userhash
     )
-    messages: list[str] = []
 
-    for file_path in file_list:
-        metrics = _scan_file(file_path)
-        upload_result = uploader.upload(file_path, metrics.size_bytes)
+    cache = None
+    if upload_cache:
+        cache = UploadCache(Path(upload_cache).expanduser())
+    needs_scan = include_stats or (
+        not custom_header and display_count is not None
+    )
+
+    def announce_file(file_path: Path) -> str:
+        with_digest = cache is not None
+        if needs_scan:
+            metrics = _scan_file(file_path, with_digest=with_digest)
+        else:
+            metrics = _stat_file(file_path, with_digest=with_digest)
+        upload_result = cache.get(metrics.digest) if cache else None
+        if upload_result is None:
+            upload_result = uploader.upload(file_path, metrics.size_bytes)
+            if cache:
+                cache.put(metrics.digest, upload_result)
         header = _resolve_header(custom_header, display_count, metrics)
-        messages.append(_build_message(header, metrics, upload_result))
+        return _build_message(header, metrics, upload_result)
 
-    return messages
+    if len(file_list) <= 1:
+        return [announce_file(file_path) for file_path in file_list]
+    max_workers = min(MAX_UPLOAD_WORKERS, len(file_list))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(announce_file, file_list))
 
 
 def _normalize_files(
@@ -169,30 +330,137 @@ def _normalize_files(
         file_iterable = list(files)
     paths = [Path(item).expanduser() for item in file_iterable]
     for path in paths:
-        if not path.exists():
-            raise FileNotFoundError(f"File not found: {path}")
-        if not path.is_file():
-            raise ValueError(f"Not a file: {path}")
+        _validate_file(path)
     return paths
 
 
-def _scan_file(file_path: Path) -> FileMetrics:
-    total_lines = 0
-    valid_ulp = 0
-    with file_path.open("r", encoding="utf-8", errors="ignore") as handle:
-        for line in handle:
-            total_lines += 1
-            if ":" in line and "[NOT_SAVED]" not in line:
-                valid_ulp += 1
-    size_bytes = os.path.getsize(file_path)
+def _validate_file(path: Path) -> None:
+    try:
+        mode = path.stat().st_mode
+    except FileNotFoundError as exc:
+        raise FileNotFoundError(f"File not found: {path}") from exc
+    if not stat.S_ISREG(mode):
+        raise ValueError(f"Not a file: {path}")
+
+
+def _scan_file(file_path: Path, with_digest: bool = False) -> FileMetrics:
+    hasher = hashlib.new(DIGEST_ALGORITHM) if with_digest else None
+    with file_path.open("rb", buffering=0) as handle:
+        size_bytes = os.fstat(handle.fileno()).st_size
+        if size_bytes < MMAP_MIN_SIZE:
+            chunks = iter(functools.partial(handle.read, READ_CHUNK_SIZE), b"")
+            total_lines, valid_ulp = _count_lines(chunks, hasher)
+        else:
+            with mmap.mmap(
+                handle.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mapped:
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                chunks = (
+                    mapped[offset : offset + READ_CHUNK_SIZE]
+                    for offset in range(0, size_bytes, READ_CHUNK_SIZE)
+                )
+                total_lines, valid_ulp = _count_lines(chunks, hasher)
     return FileMetrics(
         filename=file_path.name,
         total_lines=total_lines,
         valid_ulp=valid_ulp,
         size_bytes=size_bytes,
+        digest=hasher.hexdigest() if hasher else None,
+    )
+
+
+def _stat_file(file_path: Path, with_digest: bool = False) -> FileMetrics:
+    return FileMetrics(
+        filename=file_path.name,
+        total_lines=None,
+        valid_ulp=None,
+        size_bytes=file_path.stat().st_size,
+        digest=_file_digest(file_path) if with_digest else None,
     )
 
 
+def _file_digest(file_path: Path) -> str:
+    with file_path.open("rb") as handle:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(handle, DIGEST_ALGORITHM).hexdigest()
+        hasher = hashlib.new(DIGEST_ALGORITHM)
+        for chunk in iter(functools.partial(handle.read, READ_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+        return hasher.hexdigest()
+
+
+def _count_lines(
+    chunks: Iterable[bytes], hasher: Optional[Any] = None
+) -> tuple[int, int]:
+    total_lines = 0
+    valid_ulp = 0
+    # Only flags and a marker-sized overlap are carried for the line left
+    # open at a chunk boundary, never its bytes, so very long lines stay
+    # linear to scan.
+    keep = len(NOT_SAVED_MARKER) - 1
+    pending = False
+    has_colon = False
+    has_marker = False
+    overlap = b""
+    for chunk in chunks:
+        if hasher is not None:
+            hasher.update(chunk)
+        if not chunk:
+            continue
+        first = chunk.find(b"\n")
+        end = len(chunk) if first == -1 else first
+        has_colon = has_colon or chunk.find(ULP_SEPARATOR, 0, end) != -1
+        has_marker = (
+            has_marker
+            or chunk.find(NOT_SAVED_MARKER, 0, end) != -1
+            or bool(overlap)
+            and NOT_SAVED_MARKER in overlap + chunk[: min(end, keep)]
+        )
+        if first == -1:
+            pending = True
+            overlap = (overlap + chunk[-keep:])[-keep:]
+            continue
+        total_lines += 1
+        if has_colon and not has_marker:
+            valid_ulp += 1
+        last = chunk.rfind(b"\n")
+        if last > first:
+            block_lines, block_ulp = _count_complete_lines(
+                chunk[first + 1 : last + 1]
+            )
+            total_lines += block_lines
+            valid_ulp += block_ulp
+        pending = last + 1 < len(chunk)
+        has_colon = chunk.find(ULP_SEPARATOR, last + 1) != -1
+        has_marker = chunk.find(NOT_SAVED_MARKER, last + 1) != -1
+        overlap = chunk[max(last + 1, len(chunk) - keep) :]
+    if pending:
+        total_lines += 1
+        if has_colon and not has_marker:
+            valid_ulp += 1
+    return total_lines, valid_ulp
+
+
+def _count_complete_lines(block: bytes) -> tuple[int, int]:
+    # Dropping every byte but colons and newlines leaves each line as a run
+    # of colons, so a line holds a colon exactly when it ends in b":\n".
+    # Lines carrying the NOT_SAVED marker are rare and subtracted one by one.
+    total_lines = block.count(b"\n")
+    reduced = block.translate(None, _NON_ULP_BYTES)
+    valid_ulp = reduced.count(ULP_SEPARATOR + b"\n")
+    pos = block.find(NOT_SAVED_MARKER)
+    while pos != -1:
+        end = block.find(b"\n", pos)
+        if end == -1:
+            break
+        start = block.rfind(b"\n", 0, pos) + 1
+        if block.find(ULP_SEPARATOR, start, end) != -1:
+            valid_ulp -= 1
+        pos = block.find(NOT_SAVED_MARKER, end)
+    return total_lines, valid_ulp
+
+
 def _resolve_header(
     custom_header: Optional[str],
     display_count: Optional[Union[int, str]],
@@ -215,20 +483,32 @@ def _format_display_count(display_count: Union[int, str]) -> str:
     return str(display_count).strip()
 
 
+def _format_timestamp() -> str:
+    global _timestamp_cache
+    now = int(time.time())
+    cached_second, cached_text = _timestamp_cache
+    if now != cached_second:
+        cached_text = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+        _timestamp_cache = (now, cached_text)
+    return cached_text
+
+
 def _build_message(
     header: str, metrics: FileMetrics, upload: UploadResult
 ) -> str:
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    timestamp = _format_timestamp()
     success_text = "1/1" if upload.success else "0/1"
-    return "\n".join(
+    lines = [header, f"File: {metrics.filename}"]
+    if metrics.valid_ulp is not None:
+        lines.append(f"Valid ULP: {metrics.valid_ulp:,}")
+    if metrics.total_lines is not None:
+        lines.append(f"Valid Lines: {metrics.total_lines:,}")
+    lines.extend(
         [
-            header,
-            f"File: {metrics.filename}",
-            f"Valid ULP: {metrics.valid_ulp:,}",
-            f"Valid Lines: {metrics.total_lines:,}",
             f"Size: {metrics.size_mb:.2f} MB",
             f"{upload.host}: {upload.url}",
             f"Success: {success_text}",
             f"Time: {timestamp}",
         ]
     )
+    return "\n".join(lines)
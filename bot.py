@@ -1,16 +1,22 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import functools
 import logging
 import os
 import re
 import tempfile
 from pathlib import Path
-from typing import Iterable, Optional, Set, Tuple
+from typing import Any, Awaitable, FrozenSet, Optional, Tuple
+from urllib.parse import urlparse
 
-from telegram import KeyboardButton, ReplyKeyboardMarkup, Update
+from telegram import File, KeyboardButton, ReplyKeyboardMarkup, Update
 from telegram.constants import ChatAction
+from telegram.error import TelegramError
 from telegram.ext import (
     ApplicationBuilder,
+    BaseUpdateProcessor,
     CommandHandler,
     ContextTypes,
     MessageHandler,
@@ -18,7 +24,14 @@ from telegram.ext import (
 )
 
 from announcement_stock_bot import DEFAULT_THRESHOLD_MB, generate_announcement
-from offers_db import Offer, OfferStore, normalize_price, parse_quantity
+from offers_db import (
+    AsyncOfferStore,
+    Offer,
+    OfferStore,
+    format_price,
+    normalize_price,
+    parse_quantity,
+)
 
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
 logging.basicConfig(
@@ -28,20 +41,19 @@ logging.basicConfig(
 LOGGER = logging.getLogger("offers-bot")
 
 
-def _parse_admin_ids(value: Optional[str]) -> Set[int]:
+def _parse_admin_ids(value: Optional[str]) -> FrozenSet[int]:
     if not value:
-        return set()
-    ids = set()
-    for item in value.split(","):
-        item = item.strip()
-        if not item:
-            continue
-        ids.add(int(item))
-    return ids
+        return frozenset()
+    items = [item.strip() for item in value.split(",")]
+    try:
+        return frozenset(int(item) for item in items if item)
+    except ValueError as exc:
+        raise ValueError(
+            f"ADMIN_USER_IDS must be comma-separated user ids, got {value!r}"
+        ) from exc
 
 
 ADMIN_USER_IDS = _parse_admin_ids(os.environ.get("ADMIN_USER_IDS"))
-ANNOUNCE_CHAT_ID = os.environ.get("ANNOUNCE_CHAT_ID")
 CONTACT_TEXT = os.environ.get("CONTACT_TEXT", "LMK if interested.")
 
 
@@ -56,11 +68,57 @@ def _read_float_env(name: str, default: float) -> float:
         return default
 
 
+def _read_int_env(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        LOGGER.warning("%s must be a whole number. Using %d.", name, default)
+        return default
+
+
+def _read_optional_int_env(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError as exc:
+        # Silently dropping a bad chat id would send announcements to the
+        # wrong chat, so refuse to start instead.
+        raise ValueError(
+            f"{name} must be a whole number, got {value!r}"
+        ) from exc
+
+
+ANNOUNCE_CHAT_ID = _read_optional_int_env("ANNOUNCE_CHAT_ID")
 UPLOAD_THRESHOLD_MB = _read_float_env(
     "UPLOAD_THRESHOLD_MB", DEFAULT_THRESHOLD_MB
 )
 CATBOX_USERHASH = os.environ.get("CATBOX_USERHASH")
-
+UPLOAD_CACHE_PATH = os.environ.get("UPLOAD_CACHE_PATH")
+# RAM-backed scratch space for small document downloads, when available.
+# Container /dev/shm is often only 64 MB, so only files up to the Bot API's
+# 20 MB download limit go there.
+MEMORY_TMP_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+MEMORY_TMP_MAX_BYTES = 20 * 1024 * 1024
+TELEGRAM_POOL_SIZE = _read_int_env("TELEGRAM_POOL_SIZE", 16)
+POLL_TIMEOUT = _read_int_env("POLL_TIMEOUT", 30)
+CONCURRENT_UPDATES = _read_int_env("CONCURRENT_UPDATES", 32)
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = _read_int_env("WEBHOOK_PORT", 8443)
+# An empty value means no secret; PTB would otherwise reject every request.
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or None
+WEBHOOK_MAX_CONNECTIONS = _read_int_env("WEBHOOK_MAX_CONNECTIONS", 40)
+
+# Every handler reacts to new messages only, so Telegram need not deliver
+# edits, channel posts, reactions or membership changes.
+ALLOWED_UPDATES = [Update.MESSAGE]
+
+ADMIN_CACHE_KEY = "is_admin"
 FLOW_KEY = "flow"
 FLOW_DATA_KEY = "flow_data"
 
@@ -86,21 +144,34 @@ MENU_HELP = "Help"
 MENU_MENU = "Menu"
 MENU_CANCEL = "Cancel"
 
-MENU_LABELS = {
-    MENU_STOCK,
-    MENU_ADD,
-    MENU_SET_QTY,
-    MENU_SET_PRICE,
-    MENU_SOLD_OUT,
-    MENU_ANNOUNCE,
-    MENU_UPLOAD,
-    MENU_HELP,
-    MENU_MENU,
-    MENU_CANCEL,
-}
+MENU_LABELS = frozenset(
+    {
+        MENU_STOCK,
+        MENU_ADD,
+        MENU_SET_QTY,
+        MENU_SET_PRICE,
+        MENU_SOLD_OUT,
+        MENU_ANNOUNCE,
+        MENU_UPLOAD,
+        MENU_HELP,
+        MENU_MENU,
+        MENU_CANCEL,
+    }
+)
+
+STOCK_TRIGGERS = frozenset({"stock", "offers", "list"})
+STOCK_TRIGGER_MAX_LEN = max(len(word) for word in STOCK_TRIGGERS)
 
+SAFE_FILENAME_RE = re.compile(r"[^A-Za-z0-9._-]+")
+# Upload caption prefixes such as "display: 2.5M" or "header=Fresh batch".
+CAPTION_PREFIX_RE = re.compile(r"(display|count|header)[:= ]", re.IGNORECASE)
 
-def _get_store(context: ContextTypes.DEFAULT_TYPE) -> OfferStore:
+# The cache key is the rendered fields, so an updated quantity or price
+# simply misses the cache.
+OFFER_TEXT_CACHE_SIZE = 1024
+
+
+def _get_store(context: ContextTypes.DEFAULT_TYPE) -> AsyncOfferStore:
     store = context.application.bot_data.get("store")
     if not store:
         raise RuntimeError("OfferStore not initialized")
@@ -115,6 +186,23 @@ def _is_admin(user_id: Optional[int]) -> bool:
     return user_id in ADMIN_USER_IDS
 
 
+def _user_is_admin(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> bool:
+    # Cached per user next to the admin set it was checked against, so
+    # rebinding ADMIN_USER_IDS invalidates every cached answer.
+    user_data = context.user_data
+    cached = user_data.get(ADMIN_CACHE_KEY) if user_data is not None else None
+    if cached is not None and cached[0] is ADMIN_USER_IDS:
+        return cached[1]
+    user = update.effective_user
+    is_admin = _is_admin(user.id if user else None)
+    if user_data is not None:
+        user_data[ADMIN_CACHE_KEY] = (ADMIN_USER_IDS, is_admin)
+    return is_admin
+
+
+@functools.lru_cache(maxsize=2)
 def _build_menu(is_admin: bool) -> ReplyKeyboardMarkup:
     rows = [
         [KeyboardButton(MENU_STOCK), KeyboardButton(MENU_HELP)],
@@ -139,14 +227,18 @@ def _build_menu(is_admin: bool) -> ReplyKeyboardMarkup:
 def _set_flow(
     context: ContextTypes.DEFAULT_TYPE, flow: str, data: Optional[dict] = None
 ) -> None:
-    context.user_data[FLOW_KEY] = flow
-    if data is None:
-        context.user_data.setdefault(FLOW_DATA_KEY, {})
-    else:
-        context.user_data[FLOW_DATA_KEY] = data
+    user_data = context.user_data
+    user_data[FLOW_KEY] = flow
+    user_data[FLOW_DATA_KEY] = (
+        data if data is not None else user_data.get(FLOW_DATA_KEY, {})
+    )
 
 
 def _clear_flow(context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Flow data is only ever stored alongside a flow, so most commands
+    # (sent outside any flow) stop at this single membership test.
+    if FLOW_KEY not in context.user_data:
+        return
     context.user_data.pop(FLOW_KEY, None)
     context.user_data.pop(FLOW_DATA_KEY, None)
 
@@ -156,14 +248,14 @@ def _current_flow(context: ContextTypes.DEFAULT_TYPE) -> Optional[str]:
 
 
 def _flow_data(context: ContextTypes.DEFAULT_TYPE) -> dict:
-    return context.user_data.setdefault(FLOW_DATA_KEY, {})
+    # Steps that change the data hand it back through _set_flow.
+    return context.user_data.get(FLOW_DATA_KEY) or {}
 
 
 def _safe_filename(name: Optional[str], fallback: str) -> str:
     if not name:
         name = fallback
-    name = Path(name).name
-    safe = re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("_")
+    safe = SAFE_FILENAME_RE.sub("_", Path(name).name).strip("_")
     return safe or fallback
 
 
@@ -173,20 +265,16 @@ def _parse_upload_caption(
     if not caption:
         return None, None
     trimmed = caption.strip()
-    lowered = trimmed.lower()
-    for prefix in ("display:", "display=", "display ", "count:", "count=", "count "):
-        if lowered.startswith(prefix):
-            value = trimmed[len(prefix) :].strip()
-            return None, value or None
-    for prefix in ("header:", "header=", "header "):
-        if lowered.startswith(prefix):
-            value = trimmed[len(prefix) :].strip()
-            return value or None, None
-    return trimmed, None
+    match = CAPTION_PREFIX_RE.match(trimmed)
+    if not match:
+        return trimmed, None
+    value = trimmed[match.end() :].strip() or None
+    if match.group(1).lower() == "header":
+        return value, None
+    return None, value
 
 async def _require_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-    user_id = update.effective_user.id if update.effective_user else None
-    if not _is_admin(user_id):
+    if not _user_is_admin(update, context):
         await update.effective_message.reply_text(
             "Not authorized. Ask the owner to add you as an admin."
         )
@@ -195,35 +283,26 @@ async def _require_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 
 def _announcement_chat_id(update: Update) -> int:
-    if ANNOUNCE_CHAT_ID:
-        return int(ANNOUNCE_CHAT_ID.strip())
+    if ANNOUNCE_CHAT_ID is not None:
+        return ANNOUNCE_CHAT_ID
     if update.effective_chat is None:
         raise RuntimeError("No chat available for announcement")
     return update.effective_chat.id
 
 
-def _build_announcement(offer: Offer) -> str:
+@functools.lru_cache(maxsize=OFFER_TEXT_CACHE_SIZE)
+def _build_announcement(name: str, quantity: int, price: str) -> str:
     return (
-        f"Hey! I have {offer.name} in right now. "
-        f"{offer.quantity} available at ${offer.price}. {CONTACT_TEXT}"
+        f"Hey! I have {name} in right now. "
+        f"{quantity} available at ${price}. {CONTACT_TEXT}"
     )
 
 
-def _format_offer_line(offer: Offer) -> str:
-    return f"#{offer.id} - {offer.name} — {offer.quantity} @ ${offer.price}"
-
-
-def _format_offers(offers: Iterable[Offer]) -> str:
-    lines = ["Current stock:"]
-    lines.extend(_format_offer_line(offer) for offer in offers)
-    return "\n".join(lines)
-
-
 def _command_text(text: Optional[str]) -> str:
     if not text:
         return ""
-    parts = text.split(" ", 1)
-    return parts[1].strip() if len(parts) > 1 else ""
+    _, sep, rest = text.partition(" ")
+    return rest.strip() if sep else ""
 
 
 def _parse_offer_id(text: str) -> int:
@@ -233,7 +312,7 @@ def _parse_offer_id(text: str) -> int:
         raise ValueError("Offer id must be a number") from exc
 
 
-def _parse_add_payload(payload: str) -> tuple[str, int, str]:
+def _parse_add_payload(payload: str) -> tuple[str, int, int]:
     parts = [part.strip() for part in payload.split("|")]
     if len(parts) != 3:
         raise ValueError("Expected three values: name | quantity | price")
@@ -243,12 +322,12 @@ def _parse_add_payload(payload: str) -> tuple[str, int, str]:
     quantity = parse_quantity(quantity_text)
     if quantity <= 0:
         raise ValueError("Quantity must be greater than zero")
-    price = normalize_price(price_text)
-    return name, quantity, price
+    price_cents = normalize_price(price_text)
+    return name, quantity, price_cents
 
 
 async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    is_admin = _is_admin(update.effective_user.id if update.effective_user else None)
+    is_admin = _user_is_admin(update, context)
     menu = _build_menu(is_admin)
     lines = [
         "Welcome! Tap a button below to get started.",
@@ -272,7 +351,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    is_admin = _is_admin(update.effective_user.id if update.effective_user else None)
+    is_admin = _user_is_admin(update, context)
     lines = [
         "Customer commands:",
         "/stock - show current offers",
@@ -301,7 +380,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     _clear_flow(context)
-    is_admin = _is_admin(update.effective_user.id if update.effective_user else None)
+    is_admin = _user_is_admin(update, context)
     await update.effective_message.reply_text(
         "Canceled. You're back at the main menu.",
         reply_markup=_build_menu(is_admin),
@@ -310,22 +389,13 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def stock(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     store = _get_store(context)
-    offers = list(store.list_offers(active_only=True))
-    if not offers:
+    lines = await store.list_offer_lines(active_only=True)
+    if not lines:
         await update.effective_message.reply_text("All sold out right now.")
         return
-    await update.effective_message.reply_text(_format_offers(offers))
-
-
-async def text_stock_trigger(
-    update: Update, context: ContextTypes.DEFAULT_TYPE
-) -> None:
-    message = update.effective_message
-    if not message or not message.text:
-        return
-    text = message.text.strip().lower()
-    if text in {"stock", "offers", "list"}:
-        await stock(update, context)
+    await update.effective_message.reply_text(
+        "Current stock:\n" + "\n".join(lines)
+    )
 
 
 async def _create_offer_and_announce(
@@ -333,24 +403,48 @@ async def _create_offer_and_announce(
     context: ContextTypes.DEFAULT_TYPE,
     name: str,
     quantity: int,
-    price: str,
+    price_cents: int,
 ) -> None:
     store = _get_store(context)
-    offer = store.add_offer(name=name, quantity=quantity, price=price)
-
     announce_chat_id = _announcement_chat_id(update)
-    announcement = _build_announcement(offer)
+    announcement = _build_announcement(
+        name, quantity, format_price(price_cents)
+    )
+    # Announce first so the offer and its message ids land in one insert.
     try:
         sent = await context.bot.send_message(
             chat_id=announce_chat_id, text=announcement
         )
-        store.attach_announcement(offer.id, sent.chat.id, sent.message_id)
-    except Exception as exc:  # noqa: BLE001
+    except TelegramError as exc:
         LOGGER.warning("Announcement send failed: %s", exc)
+        offer = await store.add_offer(
+            name=name, quantity=quantity, price_cents=price_cents
+        )
         await update.effective_message.reply_text(
             f"Added offer #{offer.id}. Announcement failed: {exc}"
         )
         return
+    try:
+        offer = await store.add_offer(
+            name=name,
+            quantity=quantity,
+            price_cents=price_cents,
+            announce_chat_id=sent.chat.id,
+            announce_message_id=sent.message_id,
+        )
+    except Exception as exc:  # noqa: BLE001
+        # Without a row nothing could ever remove the post, so take it down.
+        LOGGER.warning("Saving announced offer failed: %s", exc)
+        try:
+            await context.bot.delete_message(
+                chat_id=sent.chat.id, message_id=sent.message_id
+            )
+        except TelegramError as delete_exc:
+            LOGGER.warning("Announcement delete failed: %s", delete_exc)
+        await update.effective_message.reply_text(
+            f"Could not save the offer, announcement withdrawn: {exc}"
+        )
+        return
 
     if announce_chat_id == update.effective_chat.id:
         await update.effective_message.reply_text(f"Added offer #{offer.id}.")
@@ -364,7 +458,7 @@ async def _send_offer_announcement(
     update: Update, context: ContextTypes.DEFAULT_TYPE, offer_id: int
 ) -> bool:
     store = _get_store(context)
-    offer = store.get_offer(offer_id)
+    offer = await store.get_offer(offer_id)
     if not offer or not offer.active:
         await update.effective_message.reply_text(
             "Offer not found or inactive."
@@ -372,13 +466,15 @@ async def _send_offer_announcement(
         return False
 
     announce_chat_id = _announcement_chat_id(update)
-    announcement = _build_announcement(offer)
+    announcement = _build_announcement(offer.name, offer.quantity, offer.price)
     try:
         sent = await context.bot.send_message(
             chat_id=announce_chat_id, text=announcement
         )
-        store.attach_announcement(offer.id, sent.chat.id, sent.message_id)
-    except Exception as exc:  # noqa: BLE001
+        await store.attach_announcement(
+            offer.id, sent.chat.id, sent.message_id
+        )
+    except TelegramError as exc:
         LOGGER.warning("Announcement send failed: %s", exc)
         await update.effective_message.reply_text(str(exc))
         return False
@@ -399,11 +495,13 @@ async def add_offer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
         return
     try:
-        name, quantity, price = _parse_add_payload(payload)
+        name, quantity, price_cents = _parse_add_payload(payload)
     except ValueError as exc:
         await update.effective_message.reply_text(str(exc))
         return
-    await _create_offer_and_announce(update, context, name, quantity, price)
+    await _create_offer_and_announce(
+        update, context, name, quantity, price_cents
+    )
 
 
 async def set_quantity(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -430,7 +528,7 @@ async def set_quantity(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         return
 
     store = _get_store(context)
-    offer = store.get_offer(offer_id)
+    offer = await store.get_offer(offer_id)
     if not offer:
         await update.effective_message.reply_text("Offer not found.")
         return
@@ -439,8 +537,8 @@ async def set_quantity(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await _mark_sold_out(update, context, offer)
         return
 
-    store.update_quantity(offer_id, quantity)
-    store.set_active(offer_id, True)
+    await store.update_quantity(offer_id, quantity)
+    await store.set_active(offer_id, True)
     await update.effective_message.reply_text(
         f"Updated #{offer_id} quantity to {quantity}."
     )
@@ -464,18 +562,18 @@ async def set_price(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
     try:
         offer_id = _parse_offer_id(parts[0])
-        price = normalize_price(parts[1])
+        price_cents = normalize_price(parts[1])
     except ValueError as exc:
         await update.effective_message.reply_text(str(exc))
         return
 
     store = _get_store(context)
-    if not store.get_offer(offer_id):
+    if not await store.get_offer(offer_id):
         await update.effective_message.reply_text("Offer not found.")
         return
-    store.update_price(offer_id, price)
+    await store.update_price(offer_id, price_cents)
     await update.effective_message.reply_text(
-        f"Updated #{offer_id} price to ${price}."
+        f"Updated #{offer_id} price to ${format_price(price_cents)}."
     )
 
 
@@ -494,7 +592,7 @@ async def sold_out(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
 
     store = _get_store(context)
-    offer = store.get_offer(offer_id)
+    offer = await store.get_offer(offer_id)
     if not offer:
         await update.effective_message.reply_text("Offer not found.")
         return
@@ -506,8 +604,8 @@ async def _mark_sold_out(
     update: Update, context: ContextTypes.DEFAULT_TYPE, offer: Offer
 ) -> None:
     store = _get_store(context)
-    store.update_quantity(offer.id, 0)
-    store.set_active(offer.id, False)
+    await store.update_quantity(offer.id, 0)
+    await store.set_active(offer.id, False)
     deleted = False
     if offer.announce_chat_id and offer.announce_message_id:
         try:
@@ -516,7 +614,7 @@ async def _mark_sold_out(
                 message_id=offer.announce_message_id,
             )
             deleted = True
-        except Exception as exc:  # noqa: BLE001
+        except TelegramError as exc:
             LOGGER.warning("Announcement delete failed: %s", exc)
     if deleted:
         await update.effective_message.reply_text(
@@ -578,26 +676,42 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     custom_header, display_count = _parse_upload_caption(message.caption)
     file_name = _safe_filename(document.file_name, "upload.txt")
-    await update.effective_message.reply_text(
-        "Got it. Uploading and building the announcement now."
-    )
     if update.effective_chat:
-        await context.bot.send_chat_action(
-            chat_id=update.effective_chat.id, action=ChatAction.TYPING
+        # Cosmetic only, so it should not hold up the download.
+        context.application.create_task(
+            context.bot.send_chat_action(
+                chat_id=update.effective_chat.id, action=ChatAction.TYPING
+            ),
+            update=update,
         )
 
     messages: list[str] = []
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        file_path = Path(tmp_dir) / file_name
-        telegram_file = await context.bot.get_file(document.file_id)
-        await telegram_file.download_to_drive(custom_path=str(file_path))
+    _, telegram_file = await asyncio.gather(
+        update.effective_message.reply_text(
+            "Got it. Uploading and building the announcement now."
+        ),
+        context.bot.get_file(document.file_id),
+    )
+    use_memory = bool(
+        MEMORY_TMP_DIR
+        and document.file_size
+        and document.file_size <= MEMORY_TMP_MAX_BYTES
+    )
+    with contextlib.ExitStack() as stack:
+        file_path = await _download_document(
+            telegram_file, file_name, stack, use_memory
+        )
         try:
-            messages = generate_announcement(
+            # The scan, upload and retry backoff all block, so keep them off
+            # the event loop.
+            messages = await asyncio.to_thread(
+                generate_announcement,
                 files=[file_path],
                 custom_header=custom_header,
                 display_count=display_count,
                 threshold_mb=UPLOAD_THRESHOLD_MB,
                 catbox_userhash=CATBOX_USERHASH,
+                upload_cache=UPLOAD_CACHE_PATH,
             )
         except Exception as exc:  # noqa: BLE001
             LOGGER.warning("File announcement failed: %s", exc)
@@ -608,15 +722,50 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             return
 
     announce_chat_id = _announcement_chat_id(update)
-    for outgoing in messages:
-        await context.bot.send_message(chat_id=announce_chat_id, text=outgoing)
-    if announce_chat_id != update.effective_chat.id:
+    results = await asyncio.gather(
+        *(
+            context.bot.send_message(chat_id=announce_chat_id, text=outgoing)
+            for outgoing in messages
+        ),
+        return_exceptions=True,
+    )
+    failures = [result for result in results if isinstance(result, Exception)]
+    for exc in failures:
+        LOGGER.warning("Announcement send failed: %s", exc)
+    if failures:
+        await update.effective_message.reply_text(
+            f"{len(failures)} of {len(messages)} announcements failed to send."
+        )
+    elif announce_chat_id != update.effective_chat.id:
         await update.effective_message.reply_text(
             "Uploaded and announced in the target chat."
         )
     _clear_flow(context)
 
 
+async def _download_document(
+    telegram_file: File,
+    file_name: str,
+    stack: contextlib.ExitStack,
+    use_memory: bool,
+) -> Path:
+    if use_memory:
+        tmp_dir = stack.enter_context(
+            tempfile.TemporaryDirectory(dir=MEMORY_TMP_DIR)
+        )
+        file_path = Path(tmp_dir) / file_name
+        try:
+            await telegram_file.download_to_drive(custom_path=str(file_path))
+            return file_path
+        except OSError as exc:
+            LOGGER.warning("RAM download failed, using disk: %s", exc)
+            file_path.unlink(missing_ok=True)
+    tmp_dir = stack.enter_context(tempfile.TemporaryDirectory())
+    file_path = Path(tmp_dir) / file_name
+    await telegram_file.download_to_drive(custom_path=str(file_path))
+    return file_path
+
+
 async def _start_add_flow(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
@@ -677,186 +826,258 @@ async def _start_announce_flow(
     )
 
 
-async def _handle_flow_text(
-    update: Update, context: ContextTypes.DEFAULT_TYPE, text: str
+async def _flow_add_name(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, data: dict
 ) -> None:
-    flow = _current_flow(context)
-    if not flow:
-        return
-    if not _is_admin(update.effective_user.id if update.effective_user else None):
-        _clear_flow(context)
+    name = text.strip()
+    if not name:
         await update.effective_message.reply_text(
-            "Not authorized. Ask the owner to add you as an admin."
+            "Please send a name for the offer."
         )
         return
+    data["name"] = name
+    _set_flow(context, FLOW_ADD_QTY, data)
+    await update.effective_message.reply_text(
+        "Great. Now send the quantity (whole number)."
+    )
 
-    data = _flow_data(context)
-    if flow == FLOW_ADD_NAME:
-        name = text.strip()
-        if not name:
-            await update.effective_message.reply_text(
-                "Please send a name for the offer."
-            )
-            return
-        data["name"] = name
-        _set_flow(context, FLOW_ADD_QTY, data)
-        await update.effective_message.reply_text(
-            "Great. Now send the quantity (whole number)."
-        )
-        return
 
-    if flow == FLOW_ADD_QTY:
-        try:
-            quantity = parse_quantity(text)
-        except ValueError as exc:
-            await update.effective_message.reply_text(str(exc))
-            return
-        if quantity <= 0:
-            await update.effective_message.reply_text(
-                "Quantity must be greater than zero."
-            )
-            return
-        data["quantity"] = quantity
-        _set_flow(context, FLOW_ADD_PRICE, data)
+async def _flow_add_qty(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, data: dict
+) -> None:
+    try:
+        quantity = parse_quantity(text)
+    except ValueError as exc:
+        await update.effective_message.reply_text(str(exc))
+        return
+    if quantity <= 0:
         await update.effective_message.reply_text(
-            "Almost done. Send the price (number)."
+            "Quantity must be greater than zero."
         )
         return
+    data["quantity"] = quantity
+    _set_flow(context, FLOW_ADD_PRICE, data)
+    await update.effective_message.reply_text(
+        "Almost done. Send the price (number)."
+    )
 
-    if flow == FLOW_ADD_PRICE:
-        try:
-            price = normalize_price(text)
-        except ValueError as exc:
-            await update.effective_message.reply_text(str(exc))
-            return
-        await _create_offer_and_announce(
-            update,
-            context,
-            data.get("name", "").strip(),
-            int(data.get("quantity", 0)),
-            price,
-        )
-        _clear_flow(context)
+
+async def _flow_add_price(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, data: dict
+) -> None:
+    try:
+        price_cents = normalize_price(text)
+    except ValueError as exc:
+        await update.effective_message.reply_text(str(exc))
         return
+    await _create_offer_and_announce(
+        update,
+        context,
+        data.get("name", "").strip(),
+        int(data.get("quantity", 0)),
+        price_cents,
+    )
+    _clear_flow(context)
 
-    if flow == FLOW_SET_QTY_ID:
-        try:
-            offer_id = _parse_offer_id(text)
-        except ValueError as exc:
-            await update.effective_message.reply_text(str(exc))
-            return
-        store = _get_store(context)
-        if not store.get_offer(offer_id):
-            await update.effective_message.reply_text(
-                "Offer not found. Send a valid offer ID."
-            )
-            return
-        data["offer_id"] = offer_id
-        _set_flow(context, FLOW_SET_QTY_VALUE, data)
+
+async def _flow_set_qty_id(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, data: dict
+) -> None:
+    try:
+        offer_id = _parse_offer_id(text)
+    except ValueError as exc:
+        await update.effective_message.reply_text(str(exc))
+        return
+    store = _get_store(context)
+    offer = await store.get_offer(offer_id)
+    if not offer:
         await update.effective_message.reply_text(
-            "Send the new quantity (0 to mark sold out)."
+            "Offer not found. Send a valid offer ID."
         )
         return
+    data["offer_id"] = offer_id
+    _set_flow(context, FLOW_SET_QTY_VALUE, data)
+    await update.effective_message.reply_text(
+        "Send the new quantity (0 to mark sold out)."
+    )
 
-    if flow == FLOW_SET_QTY_VALUE:
-        try:
-            quantity = parse_quantity(text)
-        except ValueError as exc:
-            await update.effective_message.reply_text(str(exc))
-            return
-        offer_id = int(data.get("offer_id", 0))
-        store = _get_store(context)
-        offer = store.get_offer(offer_id)
-        if not offer:
-            await update.effective_message.reply_text(
-                "Offer not found. Send a valid offer ID."
-            )
-            _set_flow(context, FLOW_SET_QTY_ID, {})
-            return
-        if quantity == 0:
+
+async def _flow_set_qty_value(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, data: dict
+) -> None:
+    try:
+        quantity = parse_quantity(text)
+    except ValueError as exc:
+        await update.effective_message.reply_text(str(exc))
+        return
+    offer_id = int(data.get("offer_id", 0))
+    store = _get_store(context)
+    if quantity == 0:
+        # Reload: the offer may have been re-announced since the ID step,
+        # and only the current announcement should be deleted.
+        offer = await store.get_offer(offer_id)
+        if offer:
             await _mark_sold_out(update, context, offer)
             _clear_flow(context)
             return
-        store.update_quantity(offer_id, quantity)
-        store.set_active(offer_id, True)
+    elif await store.update_quantity(offer_id, quantity):
+        await store.set_active(offer_id, True)
         await update.effective_message.reply_text(
             f"Updated #{offer_id} quantity to {quantity}."
         )
         _clear_flow(context)
         return
+    await update.effective_message.reply_text(
+        "Offer not found. Send a valid offer ID."
+    )
+    _set_flow(context, FLOW_SET_QTY_ID, {})
 
-    if flow == FLOW_SET_PRICE_ID:
-        try:
-            offer_id = _parse_offer_id(text)
-        except ValueError as exc:
-            await update.effective_message.reply_text(str(exc))
-            return
-        store = _get_store(context)
-        if not store.get_offer(offer_id):
-            await update.effective_message.reply_text(
-                "Offer not found. Send a valid offer ID."
-            )
-            return
-        data["offer_id"] = offer_id
-        _set_flow(context, FLOW_SET_PRICE_VALUE, data)
+
+async def _flow_set_price_id(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, data: dict
+) -> None:
+    try:
+        offer_id = _parse_offer_id(text)
+    except ValueError as exc:
+        await update.effective_message.reply_text(str(exc))
+        return
+    store = _get_store(context)
+    if not await store.get_offer(offer_id):
         await update.effective_message.reply_text(
-            "Send the new price."
+            "Offer not found. Send a valid offer ID."
         )
         return
+    data["offer_id"] = offer_id
+    _set_flow(context, FLOW_SET_PRICE_VALUE, data)
+    await update.effective_message.reply_text(
+        "Send the new price."
+    )
 
-    if flow == FLOW_SET_PRICE_VALUE:
-        try:
-            price = normalize_price(text)
-        except ValueError as exc:
-            await update.effective_message.reply_text(str(exc))
-            return
-        offer_id = int(data.get("offer_id", 0))
-        store = _get_store(context)
-        if not store.get_offer(offer_id):
-            await update.effective_message.reply_text(
-                "Offer not found. Send a valid offer ID."
-            )
-            _set_flow(context, FLOW_SET_PRICE_ID, {})
-            return
-        store.update_price(offer_id, price)
+
+async def _flow_set_price_value(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, data: dict
+) -> None:
+    try:
+        price_cents = normalize_price(text)
+    except ValueError as exc:
+        await update.effective_message.reply_text(str(exc))
+        return
+    offer_id = int(data.get("offer_id", 0))
+    store = _get_store(context)
+    if not await store.update_price(offer_id, price_cents):
         await update.effective_message.reply_text(
-            f"Updated #{offer_id} price to ${price}."
+            "Offer not found. Send a valid offer ID."
         )
-        _clear_flow(context)
+        _set_flow(context, FLOW_SET_PRICE_ID, {})
         return
+    await update.effective_message.reply_text(
+        f"Updated #{offer_id} price to ${format_price(price_cents)}."
+    )
+    _clear_flow(context)
 
-    if flow == FLOW_SOLD_OUT_ID:
-        try:
-            offer_id = _parse_offer_id(text)
-        except ValueError as exc:
-            await update.effective_message.reply_text(str(exc))
-            return
-        store = _get_store(context)
-        offer = store.get_offer(offer_id)
-        if not offer:
-            await update.effective_message.reply_text(
-                "Offer not found. Send a valid offer ID."
-            )
-            return
-        await _mark_sold_out(update, context, offer)
-        _clear_flow(context)
+
+async def _flow_sold_out_id(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, data: dict
+) -> None:
+    try:
+        offer_id = _parse_offer_id(text)
+    except ValueError as exc:
+        await update.effective_message.reply_text(str(exc))
+        return
+    store = _get_store(context)
+    offer = await store.get_offer(offer_id)
+    if not offer:
+        await update.effective_message.reply_text(
+            "Offer not found. Send a valid offer ID."
+        )
         return
+    await _mark_sold_out(update, context, offer)
+    _clear_flow(context)
 
-    if flow == FLOW_ANNOUNCE_ID:
-        try:
-            offer_id = _parse_offer_id(text)
-        except ValueError as exc:
-            await update.effective_message.reply_text(str(exc))
-            return
-        success = await _send_offer_announcement(update, context, offer_id)
-        if success:
-            _clear_flow(context)
+
+async def _flow_announce_id(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, data: dict
+) -> None:
+    try:
+        offer_id = _parse_offer_id(text)
+    except ValueError as exc:
+        await update.effective_message.reply_text(str(exc))
         return
+    success = await _send_offer_announcement(update, context, offer_id)
+    if success:
+        _clear_flow(context)
+
+
+async def _flow_upload_wait_file(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, data: dict
+) -> None:
+    await update.effective_message.reply_text(
+        "Please send a file as a document, or /cancel to stop."
+    )
+
+
+FLOW_HANDLERS = {
+    FLOW_ADD_NAME: _flow_add_name,
+    FLOW_ADD_QTY: _flow_add_qty,
+    FLOW_ADD_PRICE: _flow_add_price,
+    FLOW_SET_QTY_ID: _flow_set_qty_id,
+    FLOW_SET_QTY_VALUE: _flow_set_qty_value,
+    FLOW_SET_PRICE_ID: _flow_set_price_id,
+    FLOW_SET_PRICE_VALUE: _flow_set_price_value,
+    FLOW_SOLD_OUT_ID: _flow_sold_out_id,
+    FLOW_ANNOUNCE_ID: _flow_announce_id,
+    FLOW_UPLOAD_WAIT_FILE: _flow_upload_wait_file,
+}
+
 
-    if flow == FLOW_UPLOAD_WAIT_FILE:
+async def _handle_flow_text(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, text: str
+) -> None:
+    flow = _current_flow(context)
+    if not flow:
+        return
+    if not _user_is_admin(update, context):
+        _clear_flow(context)
         await update.effective_message.reply_text(
-            "Please send a file as a document, or /cancel to stop."
+            "Not authorized. Ask the owner to add you as an admin."
         )
+        return
+
+    handler = FLOW_HANDLERS.get(flow)
+    if handler:
+        await handler(update, context, text, _flow_data(context))
+
+
+MENU_HANDLERS = {
+    MENU_CANCEL: cancel,
+    MENU_MENU: show_menu,
+    MENU_HELP: help_command,
+    MENU_STOCK: stock,
+    MENU_ADD: _start_add_flow,
+    MENU_SET_QTY: _start_set_qty_flow,
+    MENU_SET_PRICE: _start_set_price_flow,
+    MENU_SOLD_OUT: _start_sold_out_flow,
+    MENU_ANNOUNCE: _start_announce_flow,
+    MENU_UPLOAD: upload_command,
+}
+
+# Menu buttons that still work while a guided step is waiting for input.
+IN_FLOW_MENU_LABELS = frozenset({MENU_CANCEL, MENU_HELP, MENU_MENU})
+
+# Aliases share one handler so PTB checks each command group only once.
+COMMAND_HANDLERS = (
+    ("start", start),
+    ("help", help_command),
+    ("menu", show_menu),
+    ("cancel", cancel),
+    (("stock", "list"), stock),
+    ("add", add_offer),
+    ("setqty", set_quantity),
+    ("setprice", set_price),
+    (("soldout", "remove"), sold_out),
+    ("announce", announce),
+    ("upload", upload_command),
+)
 
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -865,18 +1086,7 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         return
     text = message.text.strip()
 
-    if text == MENU_CANCEL:
-        await cancel(update, context)
-        return
-
-    flow = _current_flow(context)
-    if flow:
-        if text == MENU_HELP:
-            await help_command(update, context)
-            return
-        if text == MENU_MENU:
-            await show_menu(update, context)
-            return
+    if _current_flow(context) and text not in IN_FLOW_MENU_LABELS:
         if text in MENU_LABELS:
             await update.effective_message.reply_text(
                 "You're in the middle of a step. Send /cancel to stop."
@@ -885,35 +1095,59 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         await _handle_flow_text(update, context, text)
         return
 
-    if text == MENU_MENU:
-        await show_menu(update, context)
+    handler = MENU_HANDLERS.get(text)
+    if handler:
+        await handler(update, context)
         return
-    if text == MENU_HELP:
-        await help_command(update, context)
-        return
-    if text == MENU_STOCK:
+
+    if len(text) <= STOCK_TRIGGER_MAX_LEN and text.lower() in STOCK_TRIGGERS:
         await stock(update, context)
-        return
-    if text == MENU_ADD:
-        await _start_add_flow(update, context)
-        return
-    if text == MENU_SET_QTY:
-        await _start_set_qty_flow(update, context)
-        return
-    if text == MENU_SET_PRICE:
-        await _start_set_price_flow(update, context)
-        return
-    if text == MENU_SOLD_OUT:
-        await _start_sold_out_flow(update, context)
-        return
-    if text == MENU_ANNOUNCE:
-        await _start_announce_flow(update, context)
-        return
-    if text == MENU_UPLOAD:
-        await upload_command(update, context)
-        return
 
-    await text_stock_trigger(update, context)
+
+# Upper bound handed to PTB's own update semaphore; see
+# PerUserUpdateProcessor for the limit that actually applies.
+UNBOUNDED_UPDATE_SLOTS = 1 << 16
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Run updates concurrently, but one at a time for any single user.
+
+    Guided flows keep their step in user_data, so two quick messages from
+    the same admin must not race through the same flow state.
+    """
+
+    def __init__(self, max_concurrent_updates: int) -> None:
+        # PTB takes its own semaphore before do_process_update, so updates
+        # queued behind one busy user would hold global slots. Keep PTB's
+        # limit out of the way and apply ours after the per-user lock.
+        super().__init__(UNBOUNDED_UPDATE_SLOTS)
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # user id -> [lock, number of updates holding or awaiting it]
+        self._user_locks: dict[int, list] = {}
+
+    async def do_process_update(
+        self, update: object, coroutine: Awaitable[Any]
+    ) -> None:
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            async with self._slots:
+                await coroutine
+            return
+        entry = self._user_locks.setdefault(user.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], self._slots:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._user_locks[user.id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
 
 
 def main() -> None:
@@ -922,29 +1156,50 @@ def main() -> None:
         raise SystemExit("TELEGRAM_BOT_TOKEN is required")
 
     db_path = os.environ.get("OFFERS_DB_PATH", "offers.db")
-    store = OfferStore(db_path)
-
-    app = ApplicationBuilder().token(token).build()
+    store = AsyncOfferStore(OfferStore(db_path))
+
+    app = (
+        ApplicationBuilder()
+        .token(token)
+        .connection_pool_size(TELEGRAM_POOL_SIZE)
+        .connect_timeout(5)
+        .read_timeout(20)
+        .write_timeout(20)
+        .pool_timeout(5)
+        .concurrent_updates(PerUserUpdateProcessor(max(CONCURRENT_UPDATES, 1)))
+        .build()
+    )
     app.bot_data["store"] = store
 
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(CommandHandler("menu", show_menu))
-    app.add_handler(CommandHandler("cancel", cancel))
-    app.add_handler(CommandHandler("stock", stock))
-    app.add_handler(CommandHandler("list", stock))
-    app.add_handler(CommandHandler("add", add_offer))
-    app.add_handler(CommandHandler("setqty", set_quantity))
-    app.add_handler(CommandHandler("setprice", set_price))
-    app.add_handler(CommandHandler("soldout", sold_out))
-    app.add_handler(CommandHandler("remove", sold_out))
-    app.add_handler(CommandHandler("announce", announce))
-    app.add_handler(CommandHandler("upload", upload_command))
-    app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
+    for commands, callback in COMMAND_HANDLERS:
+        app.add_handler(CommandHandler(commands, callback))
+    app.add_handler(
+        MessageHandler(
+            filters.UpdateType.MESSAGE & filters.Document.ALL, handle_document
+        )
+    )
+    app.add_handler(
+        MessageHandler(
+            filters.UpdateType.MESSAGE & filters.TEXT & ~filters.COMMAND,
+            handle_text,
+        )
+    )
+
+    if WEBHOOK_URL:
+        LOGGER.info("Starting offers bot webhook on port %d...", WEBHOOK_PORT)
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=urlparse(WEBHOOK_URL).path.lstrip("/"),
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+        return
 
     LOGGER.info("Starting offers bot polling...")
-    app.run_polling()
+    app.run_polling(allowed_updates=ALLOWED_UPDATES, timeout=POLL_TIMEOUT)
 
 
 if __name__ == "__main__":
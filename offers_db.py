@@ -1,10 +1,30 @@
 from __future__ import annotations
 
+import asyncio
+import functools
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from decimal import Decimal, InvalidOperation
-from typing import Iterable, Optional
+from itertools import chain
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# INSERT ... RETURNING and ALTER TABLE ... DROP COLUMN both need 3.35.
+MIN_SQLITE_VERSION = (3, 35, 0)
+OFFER_CACHE_SIZE = 256
+# Prices are stored as INTEGER cents; cap them well below SQLite's 64-bit
+# limit so absurd input is rejected instead of failing the insert.
+MAX_PRICE_CENTS = 1_000_000 * 100
+OFFER_COLUMNS = (
+    "id, name, quantity, price_cents, active, created_at_ms,"
+    " announce_chat_id, announce_message_id"
+)
 
 
 @dataclass(frozen=True)
@@ -12,105 +32,250 @@ class Offer:
     id: int
     name: str
     quantity: int
-    price: str
+    price_cents: int
     active: bool
-    created_at: str
+    created_at_ms: int
     announce_chat_id: Optional[int]
     announce_message_id: Optional[int]
 
+    @property
+    def created_at(self) -> str:
+        return datetime.fromtimestamp(
+            self.created_at_ms / 1000, timezone.utc
+        ).isoformat()
+
+    @property
+    def price(self) -> str:
+        return format_price(self.price_cents)
+
 
 class OfferStore:
     def __init__(self, db_path: str) -> None:
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            raise RuntimeError(
+                f"OfferStore needs SQLite 3.35 or newer, found "
+                f"{sqlite3.sqlite_version}"
+            )
         self.db_path = db_path
+        # One long-lived connection keeps SQLite's page cache warm; the lock
+        # serializes access when handlers run on worker threads.
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            db_path, check_same_thread=False, cached_statements=256
+        )
+        self._offer_cache: OrderedDict[int, Offer] = OrderedDict()
+        _configure(self._conn)
         self._init_db()
 
-    def _connect(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock, self._conn:
+            yield self._conn
+
+    def _cache_offer(self, offer: Offer) -> None:
+        self._offer_cache[offer.id] = offer
+        if len(self._offer_cache) > OFFER_CACHE_SIZE:
+            self._offer_cache.popitem(last=False)
 
     def _init_db(self) -> None:
-        with self._connect() as conn:
+        with self._transaction() as conn:
+            # sqlite3 only opens a transaction implicitly before DML, so
+            # without this each ALTER TABLE would commit on its own and a
+            # failed migration could leave the schema half converted.
+            conn.execute("BEGIN")
             conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS offers (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     name TEXT NOT NULL,
                     quantity INTEGER NOT NULL,
-                    price TEXT NOT NULL,
+                    price_cents INTEGER NOT NULL,
                     active INTEGER NOT NULL DEFAULT 1,
-                    created_at TEXT NOT NULL,
+                    created_at_ms INTEGER NOT NULL,
                     announce_chat_id INTEGER,
                     announce_message_id INTEGER
                 )
                 """
             )
+            columns = {
+                row[1] for row in conn.execute("PRAGMA table_info(offers)")
+            }
+            if "price" in columns:
+                # Older databases kept the price as display text.
+                if "price_cents" not in columns:
+                    conn.execute(
+                        "ALTER TABLE offers ADD COLUMN price_cents INTEGER"
+                    )
+                conn.execute(
+                    "UPDATE offers"
+                    " SET price_cents = CAST(ROUND(price * 100) AS INTEGER)"
+                )
+                conn.execute("ALTER TABLE offers DROP COLUMN price")
+            if "created_at" in columns:
+                # Older databases kept ISO-8601 text timestamps.
+                if "created_at_ms" not in columns:
+                    conn.execute(
+                        "ALTER TABLE offers ADD COLUMN created_at_ms INTEGER"
+                    )
+                conn.execute(
+                    "UPDATE offers SET created_at_ms = CAST(ROUND("
+                    "(julianday(created_at) - 2440587.5) * 86400000"
+                    ") AS INTEGER)"
+                )
+                conn.execute("DROP INDEX IF EXISTS idx_offers_active_created")
+                conn.execute("ALTER TABLE offers DROP COLUMN created_at")
+            # The stock list only ever reads active offers newest-first, so a
+            # partial index on created_at_ms serves it without a sort step. Ids
+            # break ties between offers added within the same millisecond.
+            conn.execute("DROP INDEX IF EXISTS idx_offers_active")
             conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_offers_active ON offers(active)"
+                """
+                CREATE INDEX IF NOT EXISTS idx_offers_active_created
+                ON offers(created_at_ms DESC, id DESC) WHERE active = 1
+                """
             )
+            conn.execute("ANALYZE offers")
 
-    def add_offer(self, name: str, quantity: int, price: str) -> Offer:
-        created_at = datetime.now(timezone.utc).isoformat()
-        with self._connect() as conn:
+    def add_offer(
+        self,
+        name: str,
+        quantity: int,
+        price_cents: int,
+        announce_chat_id: Optional[int] = None,
+        announce_message_id: Optional[int] = None,
+    ) -> Offer:
+        created_at_ms = time.time_ns() // 1_000_000
+        with self._transaction() as conn:
             cur = conn.execute(
-                """
-                INSERT INTO offers (name, quantity, price, active, created_at)
-                VALUES (?, ?, ?, 1, ?)
+                f"""
+                INSERT INTO offers (
+                    name, quantity, price_cents, active, created_at_ms,
+                    announce_chat_id, announce_message_id
+                )
+                VALUES (?, ?, ?, 1, ?, ?, ?)
+                RETURNING {OFFER_COLUMNS}
                 """,
-                (name, quantity, price, created_at),
+                (
+                    name,
+                    quantity,
+                    price_cents,
+                    created_at_ms,
+                    announce_chat_id,
+                    announce_message_id,
+                ),
             )
-            offer_id = int(cur.lastrowid)
-        offer = self.get_offer(offer_id)
-        if offer is None:
-            raise RuntimeError("Failed to load offer after insert")
+            offer = _row_to_offer(cur.fetchone())
+            self._cache_offer(offer)
         return offer
 
     def get_offer(self, offer_id: int) -> Optional[Offer]:
-        with self._connect() as conn:
+        with self._transaction() as conn:
+            offer = self._offer_cache.get(offer_id)
+            if offer is not None:
+                self._offer_cache.move_to_end(offer_id)
+                return offer
             row = conn.execute(
-                "SELECT * FROM offers WHERE id = ?",
+                f"SELECT {OFFER_COLUMNS} FROM offers WHERE id = ?",
                 (offer_id,),
             ).fetchone()
-        return _row_to_offer(row) if row else None
+            if not row:
+                return None
+            offer = _row_to_offer(row)
+            self._cache_offer(offer)
+        return offer
 
     def list_offers(self, active_only: bool = True) -> Iterable[Offer]:
-        query = "SELECT * FROM offers"
-        params = ()
+        return list(chain.from_iterable(self.iter_offers(active_only)))
+
+    def iter_offers(
+        self, active_only: bool = True, block: int = 50
+    ) -> Iterator[list[Offer]]:
+        """Yield offers in blocks of ``block`` rows, newest first."""
+        query = f"SELECT {OFFER_COLUMNS} FROM offers"
+        if active_only:
+            query += " WHERE active = 1"
+        query += " ORDER BY created_at_ms DESC, id DESC"
+        # The lock is only held while fetching each block, so a slow or
+        # abandoned consumer never stalls other store calls.
+        with self._lock:
+            cur = self._conn.execute(query)
+        try:
+            while True:
+                with self._lock:
+                    rows = cur.fetchmany(block)
+                if not rows:
+                    return
+                yield [_row_to_offer(row) for row in rows]
+        finally:
+            with self._lock:
+                cur.close()
+
+    def iter_offer_lines(self, active_only: bool = True) -> Iterator[str]:
+        """Yield ready-to-display stock lines without building Offer objects."""
+        # Mirrors format_price so the lines match the Python-side rendering.
+        query = (
+            "SELECT printf('#%d - %s — %d @ $%s', id, name, quantity,"
+            " CASE"
+            " WHEN price_cents % 100 = 0 THEN price_cents / 100"
+            " WHEN price_cents % 10 = 0"
+            " THEN printf('%d.%d', price_cents / 100, price_cents % 100 / 10)"
+            " ELSE printf('%d.%02d', price_cents / 100, price_cents % 100)"
+            " END)"
+            " FROM offers"
+        )
         if active_only:
             query += " WHERE active = 1"
-        query += " ORDER BY created_at DESC"
-        with self._connect() as conn:
-            rows = conn.execute(query, params).fetchall()
-        return [_row_to_offer(row) for row in rows]
+        query += " ORDER BY created_at_ms DESC, id DESC"
+        with self._transaction() as conn:
+            rows = conn.execute(query).fetchall()
+        for (line,) in rows:
+            yield line
 
     def set_active(self, offer_id: int, active: bool) -> bool:
-        with self._connect() as conn:
+        with self._transaction() as conn:
             cur = conn.execute(
                 "UPDATE offers SET active = ? WHERE id = ?",
                 (1 if active else 0, offer_id),
             )
+            self._offer_cache.pop(offer_id, None)
         return cur.rowcount > 0
 
     def update_quantity(self, offer_id: int, quantity: int) -> bool:
-        with self._connect() as conn:
+        with self._transaction() as conn:
             cur = conn.execute(
                 "UPDATE offers SET quantity = ? WHERE id = ?",
                 (quantity, offer_id),
             )
+            self._offer_cache.pop(offer_id, None)
         return cur.rowcount > 0
 
-    def update_price(self, offer_id: int, price: str) -> bool:
-        with self._connect() as conn:
+    def update_many_quantities(self, pairs: Iterable[tuple[int, int]]) -> int:
+        """Set quantities for several ``(offer_id, quantity)`` pairs."""
+        params = [(quantity, offer_id) for offer_id, quantity in pairs]
+        if not params:
+            return 0
+        with self._transaction() as conn:
+            cur = conn.executemany(
+                "UPDATE offers SET quantity = ? WHERE id = ?",
+                params,
+            )
+            for _, offer_id in params:
+                self._offer_cache.pop(offer_id, None)
+        return cur.rowcount
+
+    def update_price(self, offer_id: int, price_cents: int) -> bool:
+        with self._transaction() as conn:
             cur = conn.execute(
-                "UPDATE offers SET price = ? WHERE id = ?",
-                (price, offer_id),
+                "UPDATE offers SET price_cents = ? WHERE id = ?",
+                (price_cents, offer_id),
             )
+            self._offer_cache.pop(offer_id, None)
         return cur.rowcount > 0
 
     def attach_announcement(
         self, offer_id: int, chat_id: int, message_id: int
     ) -> bool:
-        with self._connect() as conn:
+        with self._transaction() as conn:
             cur = conn.execute(
                 """
                 UPDATE offers
@@ -119,19 +284,126 @@ class OfferStore:
                 """,
                 (chat_id, message_id, offer_id),
             )
+            self._offer_cache.pop(offer_id, None)
         return cur.rowcount > 0
 
 
-def normalize_price(value: str) -> str:
-    try:
-        dec = Decimal(value)
-    except InvalidOperation as exc:
-        raise ValueError("Price must be a number") from exc
-    if dec <= 0:
+class AsyncOfferStore:
+    """Awaitable facade that runs OfferStore calls on a worker pool.
+
+    Keeps SQLite reads and commits off the event loop so other updates are
+    handled while a query is in flight.
+    """
+
+    def __init__(self, store: OfferStore, max_workers: int = 8) -> None:
+        self.store = store
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="offer-store"
+        )
+
+    async def _run(
+        self, func: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._pool, functools.partial(func, *args, **kwargs)
+        )
+
+    async def add_offer(
+        self,
+        name: str,
+        quantity: int,
+        price_cents: int,
+        announce_chat_id: Optional[int] = None,
+        announce_message_id: Optional[int] = None,
+    ) -> Offer:
+        return await self._run(
+            self.store.add_offer,
+            name,
+            quantity,
+            price_cents,
+            announce_chat_id,
+            announce_message_id,
+        )
+
+    async def get_offer(self, offer_id: int) -> Optional[Offer]:
+        return await self._run(self.store.get_offer, offer_id)
+
+    async def list_offers(self, active_only: bool = True) -> list[Offer]:
+        return await self._run(self.store.list_offers, active_only)
+
+    async def list_offer_lines(self, active_only: bool = True) -> list[str]:
+        return await self._run(
+            lambda: list(self.store.iter_offer_lines(active_only))
+        )
+
+    async def set_active(self, offer_id: int, active: bool) -> bool:
+        return await self._run(self.store.set_active, offer_id, active)
+
+    async def update_quantity(self, offer_id: int, quantity: int) -> bool:
+        return await self._run(self.store.update_quantity, offer_id, quantity)
+
+    async def update_many_quantities(
+        self, pairs: Iterable[tuple[int, int]]
+    ) -> int:
+        return await self._run(self.store.update_many_quantities, list(pairs))
+
+    async def update_price(self, offer_id: int, price_cents: int) -> bool:
+        return await self._run(
+            self.store.update_price, offer_id, price_cents
+        )
+
+    async def attach_announcement(
+        self, offer_id: int, chat_id: int, message_id: int
+    ) -> bool:
+        return await self._run(
+            self.store.attach_announcement, offer_id, chat_id, message_id
+        )
+
+
+def _configure(conn: sqlite3.Connection) -> None:
+    # WAL lets readers run during writes, and with synchronous=NORMAL a
+    # commit no longer waits on an fsync.
+    for pragma in (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-64000",
+        "PRAGMA mmap_size=268435456",
+        "PRAGMA busy_timeout=30000",
+    ):
+        conn.execute(pragma)
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_price(value: str) -> int:
+    """Parse a user-entered price into whole cents, rounding half up."""
+    text = value.strip()
+    sign = text[:1]
+    if sign in ("+", "-"):
+        text = text[1:]
+    whole, _, frac = text.partition(".")
+    if not (whole or frac) or not _is_digits(whole) or not _is_digits(frac):
+        raise ValueError("Price must be a number")
+    cents = int(whole or "0") * 100 + int(frac[:2].ljust(2, "0"))
+    if frac[2:3] >= "5":
+        cents += 1
+    if sign == "-" or cents <= 0:
         raise ValueError("Price must be greater than zero")
-    if dec == dec.to_integral():
-        return str(dec.quantize(Decimal("1")))
-    return f"{dec.quantize(Decimal('0.01')):.2f}".rstrip("0").rstrip(".")
+    if cents > MAX_PRICE_CENTS:
+        raise ValueError(
+            f"Price must be at most ${format_price(MAX_PRICE_CENTS)}"
+        )
+    return cents
+
+
+def format_price(cents: int) -> str:
+    dollars, rem = divmod(cents, 100)
+    if not rem:
+        return str(dollars)
+    if rem % 10 == 0:
+        return f"{dollars}.{rem // 10}"
+    return f"{dollars}.{rem:02d}"
 
 
 def parse_quantity(value: str) -> int:
@@ -144,14 +416,12 @@ def parse_quantity(value: str) -> int:
     return quantity
 
 
-def _row_to_offer(row: sqlite3.Row) -> Offer:
-    return Offer(
-        id=int(row["id"]),
-        name=str(row["name"]),
-        quantity=int(row["quantity"]),
-        price=str(row["price"]),
-        active=bool(row["active"]),
-        created_at=str(row["created_at"]),
-        announce_chat_id=row["announce_chat_id"],
-        announce_message_id=row["announce_message_id"],
-    )
+def _is_digits(text: str) -> bool:
+    return not text or (text.isascii() and text.isdigit())
+
+
+def _row_to_offer(row: tuple) -> Offer:
+    # Rows arrive as plain tuples in OFFER_COLUMNS order, already holding the
+    # right Python types; only ``active`` needs converting from 0/1.
+    id_, name, quantity, price_cents, active, *rest = row
+    return Offer(id_, name, quantity, price_cents, bool(active), *rest)